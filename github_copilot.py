@@ -10,6 +10,14 @@ import html
 import glob
 import re
 import os
+import hashlib
+import difflib
+import http.client
+import socket
+import ssl
+import io
+import base64
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Constants
@@ -19,6 +27,407 @@ GITHUB_TOKEN_URL = "https://github.com/login/oauth/access_token"
 GITHUB_USER_API_URL = "https://api.github.com/user"
 COPILOT_API_URL = "https://api.githubcopilot.com/chat/completions"
 COPILOT_MODELS_URL = "https://api.githubcopilot.com/v1/models"
+COPILOT_API_HOST = "api.githubcopilot.com"
+USER_AGENT = "GitHubCopilot/1.200.0.0 (sublime; 4169; x64)"
+
+class CopilotConnectionPool:
+    """Keep-alive HTTPS connections to the Copilot API host.
+
+    warm_up() pays DNS, TCP and TLS setup ahead of the first request. Idle
+    connections are closed again after idle_timeout seconds.
+    """
+    def __init__(self, host, idle_timeout=90):
+        self.host = host
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.reaper = None
+        self.context = ssl.create_default_context()
+
+    def acquire(self, timeout):
+        """Return (connection, reused)"""
+        now = time.monotonic()
+        with self.lock:
+            while self.idle:
+                conn, last_used = self.idle.pop()
+                if now - last_used < self.idle_timeout:
+                    conn.timeout = timeout
+                    if conn.sock: conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        return self.new_connection(timeout), False
+
+    def new_connection(self, timeout):
+        """Open a connection to the host, tunnelling through the HTTPS proxy if one is configured"""
+        proxy = urllib.request.getproxies().get("https")
+        if not proxy or urllib.request.proxy_bypass(self.host):
+            return http.client.HTTPSConnection(self.host, timeout=timeout, context=self.context)
+        if "://" not in proxy: proxy = "http://" + proxy
+        parts = urllib.parse.urlsplit(proxy)
+        conn = http.client.HTTPSConnection(parts.hostname, parts.port or 80, timeout=timeout, context=self.context)
+        headers = {}
+        if parts.username:
+            credentials = f"{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or '')}"
+            headers['Proxy-Authorization'] = "Basic " + base64.b64encode(credentials.encode()).decode()
+        conn.set_tunnel(self.host, 443, headers)
+        return conn
+
+    def release(self, conn):
+        with self.lock:
+            self.idle.append((conn, time.monotonic()))
+            if self.reaper is None:
+                self.reaper = threading.Timer(self.idle_timeout, self.reap)
+                self.reaper.daemon = True
+                self.reaper.start()
+
+    def reap(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [c for c, last_used in self.idle if now - last_used >= self.idle_timeout]
+            self.idle = [(c, t) for c, t in self.idle if now - t < self.idle_timeout]
+            self.reaper = None
+            if self.idle:
+                oldest = min(t for _, t in self.idle)
+                self.reaper = threading.Timer(self.idle_timeout - (now - oldest), self.reap)
+                self.reaper.daemon = True
+                self.reaper.start()
+        for conn in expired:
+            conn.close()
+
+    def warm_up(self, timeout=10):
+        """Resolve DNS and open a TLS connection (through the proxy, if any) unless one is already idle"""
+        with self.lock:
+            if self.idle: return
+        conn = self.new_connection(timeout)
+        conn.connect()
+        self.release(conn)
+
+    def request(self, method, path, body=None, headers=None, timeout=45, handle=None):
+        """Send a request on a pooled connection and return (status, headers, body)"""
+        for attempt in range(2):
+            conn, reused = self.acquire(timeout)
+            if handle is not None:
+                with handle.lock:
+                    handle.connection = conn
+                    cancelled = handle.cancelled
+                if cancelled:
+                    conn.close(); raise Exception("Request cancelled")
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # The server closed an idle keep-alive connection; retry once on a fresh one
+                if reused and attempt == 0 and not (handle and handle.cancelled): continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            # Detach before releasing so a late cancel() cannot shut down a socket another request reuses
+            cancelled = handle.detach() if handle is not None else False
+            if response.will_close or cancelled: conn.close()
+            else: self.release(conn)
+            return response.status, response.headers, data
+
+COPILOT_POOL = CopilotConnectionPool(COPILOT_API_HOST)
+
+class RequestHandle:
+    """Lets another thread cancel an in-flight Copilot request"""
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connection = None
+        self.cancelled = False
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.connection is not None:
+                try:
+                    if self.connection.sock: self.connection.sock.shutdown(socket.SHUT_RDWR)
+                    self.connection.close()
+                except Exception: pass
+
+    def detach(self):
+        """Stop tracking the connection once its response is read; returns whether it was cancelled"""
+        with self.lock:
+            self.connection = None
+            return self.cancelled
+
+def _copilot_api_get(access_token, url, timeout=45):
+    """GET a Copilot API endpoint through the connection pool and return the decoded JSON"""
+    headers = {'Authorization': f'Bearer {access_token}', 'User-Agent': USER_AGENT}
+    status, response_headers, body = COPILOT_POOL.request("GET", urllib.parse.urlsplit(url).path, headers=headers, timeout=timeout)
+    if status >= 400:
+        raise urllib.error.HTTPError(url, status, http.client.responses.get(status, ""), response_headers, io.BytesIO(body))
+    return json.loads(body.decode())
+
+def _copilot_request(access_token, payload, timeout=45, handle=None):
+    """POST a chat completion payload and return the decoded JSON result"""
+    data = json.dumps(payload).encode()
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'User-Agent': USER_AGENT
+    }
+    status, response_headers, body = COPILOT_POOL.request(
+        "POST", urllib.parse.urlsplit(COPILOT_API_URL).path, body=data, headers=headers, timeout=timeout, handle=handle
+    )
+    if status >= 400:
+        raise urllib.error.HTTPError(COPILOT_API_URL, status, http.client.responses.get(status, ""), response_headers, io.BytesIO(body))
+    return json.loads(body.decode())
+
+class ModelRouter:
+    """Picks a model per request from prompt size and observed rolling latency"""
+    def __init__(self, window_size=20, base_cooldown=30, max_cooldown=600):
+        self.window_size = window_size
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.latencies = {}
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self.lock:
+            samples = self.latencies.setdefault(model, [])
+            samples.append(seconds)
+            del samples[:-self.window_size]
+            self.failures.pop(model, None)
+
+    def record_failure(self, model):
+        """Keep a failing model out of rotation, backing off exponentially"""
+        with self.lock:
+            count, _ = self.failures.get(model, (0, 0.0))
+            cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** count)
+            self.failures[model] = (count + 1, time.monotonic() + cooldown)
+
+    def is_cooling_down(self, model):
+        with self.lock:
+            _, until = self.failures.get(model, (0, 0.0))
+        return time.monotonic() < until
+
+    def median_latency(self, model):
+        with self.lock:
+            samples = sorted(self.latencies.get(model, []))
+        return samples[len(samples) // 2] if samples else None
+
+    def rank(self, models):
+        """Fastest first; models without samples go first so they get measured.
+
+        Models in a failure cooldown are dropped unless every model is cooling down.
+        """
+        available = [m for m in models if not self.is_cooling_down(m)] or list(models)
+        def key(model):
+            latency = self.median_latency(model)
+            return (latency is not None, latency or 0.0)
+        return sorted(available, key=key)
+
+    def choose(self, messages, settings):
+        """Return (primary_model, fallback_model_or_None) for a request"""
+        selected = settings.get("selected_model", "gpt-4o")
+        fallback = settings.get("hedge_fallback_model")
+        candidates = settings.get("routing_models")
+        # Routing only experiments on models the user listed explicitly
+        if not settings.get("model_routing", False) or not candidates:
+            return selected, (fallback if fallback != selected else None)
+
+        ranked = self.rank(candidates)
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        long_context_model = settings.get("routing_long_context_model")
+        if (long_context_model and not self.is_cooling_down(long_context_model)
+                and prompt_chars >= settings.get("routing_long_context_chars", 24000)):
+            primary = long_context_model
+        else:
+            primary = ranked[0]
+        if not fallback or fallback == primary:
+            fallback = next((m for m in ranked if m != primary), None)
+        return primary, fallback
+
+MODEL_ROUTER = ModelRouter()
+
+class HedgedRequest:
+    """Sends a request to the primary model and, if it has not answered within
+    the hedge deadline, the same request to a fallback. The first successful
+    answer wins and the other attempt is cancelled.
+    """
+    def __init__(self, access_token, payload, timeout):
+        self.access_token = access_token
+        self.payload = payload
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        self.attempts = {}
+        self.running = 0
+        self.winner = None
+        self.errors = []
+
+    def launch(self, model):
+        handle = RequestHandle()
+        with self.cond:
+            self.attempts[model] = handle
+            self.running += 1
+        threading.Thread(target=self.attempt, args=(model, handle)).start()
+
+    def attempt(self, model, handle):
+        try:
+            result = _copilot_request(self.access_token, dict(self.payload, model=model), self.timeout, handle)
+            if not result.get('choices'):
+                raise Exception(f"Invalid response format: {result}")
+        except Exception as e:
+            with self.cond:
+                handle.finished = True
+                self.running -= 1
+                if not handle.cancelled:
+                    self.errors.append(e)
+                    MODEL_ROUTER.record_failure(model)
+                self.cond.notify_all()
+            return
+        with self.cond:
+            handle.finished = True
+            self.running -= 1
+            if self.winner is None and not handle.cancelled:
+                self.winner = (result, model)
+                MODEL_ROUTER.record(model, time.monotonic() - handle.started)
+            self.cond.notify_all()
+
+    def wait(self, seconds=None):
+        with self.cond:
+            self.cond.wait_for(lambda: self.winner is not None or self.running == 0, timeout=seconds)
+
+    def run(self, primary, fallback, hedge_after):
+        self.launch(primary)
+        self.wait(hedge_after)
+        if self.winner is None:
+            self.launch(fallback)
+            self.wait()
+
+        with self.cond:
+            for model, handle in self.attempts.items():
+                if self.winner and model != self.winner[1] and not handle.finished:
+                    # A loser that was still running is at least this slow
+                    MODEL_ROUTER.record(model, time.monotonic() - handle.started)
+                    handle.cancel()
+        if self.winner is not None:
+            return self.winner
+        raise self.errors[0]
+
+def _routed_request(settings, access_token, payload, timeout=45):
+    """Send a chat completion through the model router.
+
+    Returns (result, model) where model is the one that produced the answer.
+    """
+    primary, fallback = MODEL_ROUTER.choose(payload["messages"], settings)
+    hedge_after = settings.get("hedge_after_seconds", 0)
+    if fallback and hedge_after and hedge_after > 0:
+        return HedgedRequest(access_token, payload, timeout).run(primary, fallback, hedge_after)
+
+    started = time.monotonic()
+    try:
+        result = _copilot_request(access_token, dict(payload, model=primary), timeout)
+    except Exception:
+        MODEL_ROUTER.record_failure(primary)
+        raise
+    MODEL_ROUTER.record(primary, time.monotonic() - started)
+    return result, primary
+
+class UiScheduler:
+    """Coalesces view mutations into a single update per view per frame.
+
+    Worker threads post text updates and phantom changes here instead of each
+    running their own set_timeout loop. One frame timer flushes everything that
+    is pending, keeping only the latest phantoms per PhantomSet, and advances
+    progress animations only for views that are currently visible.
+    """
+    FRAME_MS = 100
+    ANIMATION_STEP = 0.5
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.animations = {}
+        self.scheduled = False
+
+    def post(self, view, fn):
+        """Run fn on the UI thread in the next frame"""
+        with self.lock:
+            self.entry(view)["tasks"].append(fn)
+        self.schedule()
+
+    def set_phantoms(self, view, phantom_set, phantoms):
+        """Replace the phantoms of phantom_set in the next frame"""
+        with self.lock:
+            self.entry(view)["phantoms"][id(phantom_set)] = (phantom_set, phantoms)
+        self.schedule()
+
+    def animate(self, view, key, render):
+        """Call render(step) whenever the animation step changes and view is visible"""
+        with self.lock:
+            self.animations[(view.id(), key)] = {"view": view, "render": render, "started": time.monotonic(), "step": -1}
+        self.schedule()
+
+    def stop(self, view, key):
+        with self.lock:
+            self.animations.pop((view.id(), key), None)
+
+    def entry(self, view):
+        view_id = view.id() if view is not None else 0
+        return self.pending.setdefault(view_id, {"view": view, "tasks": [], "phantoms": {}})
+
+    def schedule(self):
+        with self.lock:
+            if self.scheduled: return
+            self.scheduled = True
+        sublime.set_timeout(self.frame, self.FRAME_MS)
+
+    def is_visible(self, view):
+        window = view.window()
+        if not window: return False
+        group, _ = window.get_view_index(view)
+        return group >= 0 and window.active_view_in_group(group) == view
+
+    def frame(self):
+        # Reset first so an error below can never leave the scheduler stalled
+        with self.lock:
+            self.scheduled = False
+            animations = list(self.animations.items())
+        now = time.monotonic()
+        for key, animation in animations:
+            view = animation["view"]
+            if not view.is_valid():
+                self.stop(view, key[1]); continue
+            step = int((now - animation["started"]) / self.ANIMATION_STEP)
+            if step != animation["step"] and self.is_visible(view):
+                animation["step"] = step
+                try: animation["render"](step)
+                except Exception as e:
+                    print(f"GitHub Copilot UI animation failed: {e}")
+                    self.stop(view, key[1])
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for view_id, entry in pending.items():
+            view = entry["view"]
+            if view is not None and not view.is_valid(): continue
+            for fn in entry["tasks"]:
+                try: fn()
+                except Exception as e: print(f"GitHub Copilot UI update failed: {e}")
+            # Phantoms set by the tasks above (e.g. a progress clear) supersede this frame's batch
+            with self.lock:
+                newer = self.pending.get(view_id)
+                if newer:
+                    entry["phantoms"].update(newer["phantoms"])
+                    newer["phantoms"] = {}
+            for phantom_set, phantoms in entry["phantoms"].values():
+                try: phantom_set.update(phantoms)
+                except Exception as e: print(f"GitHub Copilot UI update failed: {e}")
+
+        with self.lock:
+            busy = bool(self.animations or self.pending)
+        if busy: self.schedule()
+
+UI_SCHEDULER = UiScheduler()
 
 class GithubCopilotCommand(sublime_plugin.WindowCommand):
     def __init__(self, window):
@@ -30,6 +439,8 @@ class GithubCopilotCommand(sublime_plugin.WindowCommand):
         self.settings = sublime.load_settings("github_copilot.sublime-settings")
         self.chat_panel_visible = False
         self.original_layout = None
+        self.last_warm_up = 0
+        self.cached_models = None
         self.load_settings()
 
     # <--- PERBAIKAN: Method yang hilang dikembalikan ---
@@ -85,8 +496,50 @@ class GithubCopilotCommand(sublime_plugin.WindowCommand):
         if self.is_authenticated():
             sublime.set_timeout(lambda: self.show_input_panel(), 100)
 
+    def warm_up(self):
+        """Prepare the network path in the background so the first request is not slower than later ones"""
+        if not self.is_authenticated() or not self.settings.get("warm_up_connections", True):
+            return
+        COPILOT_POOL.idle_timeout = self.settings.get("connection_idle_timeout", 90)
+        if time.monotonic() - self.last_warm_up < COPILOT_POOL.idle_timeout / 2:
+            return
+        self.last_warm_up = time.monotonic()
+        threading.Thread(target=self.warm_up_async).start()
+
+    def warm_up_async(self):
+        try:
+            COPILOT_POOL.warm_up()
+        except Exception as e:
+            print(f"GitHub Copilot warm-up: connection failed: {e}")
+
+        try:
+            req = urllib.request.Request(GITHUB_USER_API_URL)
+            req.add_header('Authorization', f'Bearer {self.access_token}')
+            req.add_header('Accept', 'application/vnd.github.v3+json')
+            with urllib.request.urlopen(req, timeout=10) as response:
+                username = json.loads(response.read().decode()).get('login')
+                if username and username != self.username:
+                    self.save_setting("username", username)
+                    self.username = username
+        except urllib.error.HTTPError as e:
+            if e.code == 401:
+                sublime.set_timeout(lambda: sublime.status_message("GitHub Copilot: token is no longer valid, please re-authenticate."), 0)
+                return
+            print(f"GitHub Copilot warm-up: token check failed: HTTP {e.code}")
+        except Exception as e:
+            print(f"GitHub Copilot warm-up: token check failed: {e}")
+
+        try:
+            models_data = _copilot_api_get(self.access_token, COPILOT_MODELS_URL, timeout=10)
+            model_ids = [m['id'] for m in models_data.get('data', []) if "gpt" in m['id']]
+            # Kept in memory only; the user's available_models setting is left untouched
+            if model_ids: self.cached_models = model_ids
+        except Exception as e:
+            print(f"GitHub Copilot warm-up: model refresh failed: {e}")
+
     def show_chat_panel(self):
         """Show chat panel in right column"""
+        self.warm_up()
         if not self.original_layout:
             self.original_layout = self.window.get_layout()
         
@@ -205,38 +658,30 @@ class GithubCopilotCommand(sublime_plugin.WindowCommand):
                 "stream": False
             }
             
-            data = json.dumps(payload).encode()
-            req = urllib.request.Request(COPILOT_API_URL, data=data)
-            req.add_header('Authorization', f'Bearer {self.access_token}')
-            req.add_header('Content-Type', 'application/json')
-            req.add_header('Accept', 'application/json')
-            req.add_header('User-Agent', 'GitHubCopilot/1.200.0.0 (sublime; 4169; x64)')
-
-            with urllib.request.urlopen(req, timeout=45) as response:
-                result = json.loads(response.read().decode())
+            result, selected_model = _routed_request(self.settings, self.access_token, payload)
                 
-                if 'choices' in result and result['choices']:
-                    assistant_message = result['choices'][0]['message']['content']
-                    self.chat_history.append({"role": "user", "content": message})
-                    self.chat_history.append({"role": "assistant", "content": assistant_message})
-
-                    self.stop_typing_effect()
-                    timestamp = datetime.now().strftime("%H:%M:%S")
-                    formatted_response = self.format_response(assistant_message)
-                    response_msg = f"\n─────────────────────────────\n[{timestamp}] 🤖 Copilot ({selected_model}):\n{formatted_response}\n"
-                    sublime.set_timeout(lambda: self.update_chat_with_response(response_msg), 0)
-                else:
-                    raise Exception(f"Invalid response format: {result}")
+            if 'choices' in result and result['choices']:
+                assistant_message = result['choices'][0]['message']['content']
+                self.chat_history.append({"role": "user", "content": message})
+                self.chat_history.append({"role": "assistant", "content": assistant_message})
+
+                self.stop_typing_effect()
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                formatted_response = self.format_response(assistant_message)
+                response_msg = f"\n─────────────────────────────\n[{timestamp}] 🤖 Copilot ({selected_model}):\n{formatted_response}\n"
+                UI_SCHEDULER.post(self.chat_view, lambda: self.update_chat_with_response(response_msg))
+            else:
+                raise Exception(f"Invalid response format: {result}")
                     
         except urllib.error.HTTPError as e:
             error_body = e.read().decode(errors='ignore') if hasattr(e, 'read') else str(e)
             error_msg = f"API Error: HTTP {e.code} - {error_body}\n"
             self.stop_typing_effect()
-            sublime.set_timeout(lambda: self.update_chat_with_response(error_msg), 0)
+            UI_SCHEDULER.post(self.chat_view, lambda: self.update_chat_with_response(error_msg))
         except Exception as e:
             self.stop_typing_effect()
             error_msg = f"Unexpected error: {str(e)}\n"
-            sublime.set_timeout(lambda: self.update_chat_with_response(error_msg), 0)
+            UI_SCHEDULER.post(self.chat_view, lambda: self.update_chat_with_response(error_msg))
 
     def format_response(self, response):
         """Format response with separators for code blocks"""
@@ -247,17 +692,19 @@ class GithubCopilotCommand(sublime_plugin.WindowCommand):
     def start_typing_effect(self):
         """Start typing effect animation"""
         self.typing_active = True
-        self.typing_dots = 0
-        sublime.set_timeout(lambda: self.update_typing_indicator(), 0)
+        if self.chat_view:
+            UI_SCHEDULER.animate(self.chat_view, "typing", self.update_typing_indicator)
 
     def stop_typing_effect(self):
         """Stop typing effect animation"""
         self.typing_active = False
+        if self.chat_view:
+            UI_SCHEDULER.stop(self.chat_view, "typing")
 
-    def update_typing_indicator(self):
-        """Update typing indicator with animation"""
+    def update_typing_indicator(self, step):
+        """Update typing indicator, called by UI_SCHEDULER once per animation step"""
         if not self.typing_active: return
-        dots = "." * (self.typing_dots % 4)
+        dots = "." * (step % 4)
         typing_text = f"Copilot is typing{dots}   "
         if self.chat_view and self.chat_view.is_valid():
             current_content = self.chat_view.substr(sublime.Region(0, self.chat_view.size()))
@@ -269,12 +716,9 @@ class GithubCopilotCommand(sublime_plugin.WindowCommand):
             if not found:
                 lines.append(typing_text)
                 self.update_chat_view('\n'.join(lines))
-                sublime.set_timeout(lambda: self.chat_view.show(self.chat_view.size()), 0)
+                self.chat_view.show(self.chat_view.size())
             else:
                 self.update_chat_view('\n'.join(lines))
-        self.typing_dots += 1
-        if self.typing_active:
-            sublime.set_timeout(lambda: self.update_typing_indicator(), 500)
     
     def update_chat_with_response(self, response_text):
         """Update chat view removing typing indicator and adding response"""
@@ -420,7 +864,7 @@ class GithubCopilotFetchModelsCommand(sublime_plugin.WindowCommand):
 class GithubCopilotSelectModelCommand(sublime_plugin.WindowCommand):
     def run(self):
         copilot_cmd = GithubCopilotCommand.get_instance(self.window)
-        available_models = copilot_cmd.settings.get('available_models', [])
+        available_models = copilot_cmd.cached_models or copilot_cmd.settings.get('available_models', [])
         if not available_models:
             sublime.error_message("No available models found. Please run 'GitHub Copilot: Fetch Available Models' first.")
             return
@@ -471,11 +915,11 @@ class GithubCopilotInlineEditCommand(sublime_plugin.TextCommand):
             
             self.progress_active = True
             self.progress_dots = 0
-            self.show_progress_phantom()
-            self.animate_progress_phantom()
+            UI_SCHEDULER.animate(self.view, "copilot_inline_progress", self.animate_progress_phantom)
 
             threading.Thread(target=self.ask_copilot_and_replace, args=(messages, [ (r.a, r.b) for r in sels ])).start()
 
+        copilot_cmd.warm_up()
         window.show_input_panel("Prompt for Copilot (inline edit):", "", on_done, None, None)
 
     def show_progress_phantom(self):
@@ -502,19 +946,19 @@ class GithubCopilotInlineEditCommand(sublime_plugin.TextCommand):
             </body>
         '''
         phantom = sublime.Phantom(region, html, sublime.LAYOUT_BLOCK)
-        self.phantom_set.update([phantom])
+        UI_SCHEDULER.set_phantoms(self.view, self.phantom_set, [phantom])
 
 
-    def animate_progress_phantom(self):
+    def animate_progress_phantom(self, step):
         if not getattr(self, "progress_active", False):
             return
-        self.progress_dots += 1
+        self.progress_dots = step
         self.show_progress_phantom()
-        sublime.set_timeout(self.animate_progress_phantom, 500)
 
     def clear_progress_phantom(self):
         self.progress_active = False
-        if hasattr(self, "phantom_set"): self.phantom_set.update([])
+        UI_SCHEDULER.stop(self.view, "copilot_inline_progress")
+        if hasattr(self, "phantom_set"): UI_SCHEDULER.set_phantoms(self.view, self.phantom_set, [])
     
     def ask_copilot_and_replace(self, messages, sel_ranges):
         window = self.view.window()
@@ -528,24 +972,16 @@ class GithubCopilotInlineEditCommand(sublime_plugin.TextCommand):
                 "max_tokens": 2000,
                 "stream": False
             }
-            data = json.dumps(payload).encode()
-            req = urllib.request.Request(COPILOT_API_URL, data=data)
-            req.add_header('Authorization', f'Bearer {copilot_cmd.access_token}')
-            req.add_header('Content-Type', 'application/json')
-            req.add_header('Accept', 'application/json')
-            req.add_header('User-Agent', 'GitHubCopilot/1.200.0.0 (sublime; 4169; x64)')
-
-            with urllib.request.urlopen(req, timeout=45) as response:
-                result = json.loads(response.read().decode())
-                if 'choices' in result and result['choices']:
-                    assistant_message = result['choices'][0]['message']['content']
-                    code = self.extract_code(assistant_message)
-                    sublime.set_timeout(lambda: [
-                        self.clear_progress_phantom(),
-                        self.view.run_command("replace_selection_with_code", {"code": code, "regions": sel_ranges})
-                    ], 0)
+            result, _ = _routed_request(copilot_cmd.settings, copilot_cmd.access_token, payload)
+            if 'choices' in result and result['choices']:
+                assistant_message = result['choices'][0]['message']['content']
+                code = self.extract_code(assistant_message)
+                UI_SCHEDULER.post(self.view, lambda: [
+                    self.clear_progress_phantom(),
+                    self.view.run_command("replace_selection_with_code", {"code": code, "regions": sel_ranges})
+                ])
         except Exception as e:
-            sublime.set_timeout(lambda e=e: [self.clear_progress_phantom(), sublime.error_message(f"Copilot error: {e}")], 0)
+            UI_SCHEDULER.post(self.view, lambda e=e: [self.clear_progress_phantom(), sublime.error_message(f"Copilot error: {e}")])
 
     def extract_code(self, text):
         if "```" in text:
@@ -604,19 +1040,21 @@ class GithubCopilotGenerateCodeCommand(sublime_plugin.TextCommand):
             self.progress_active = True
             self.progress_dots = 0
             self.phantom_set = sublime.PhantomSet(self.view, "copilot_gen_progress")
-            self._animate_progress()
+            UI_SCHEDULER.animate(self.view, "copilot_gen_progress", self._animate_progress)
 
             threading.Thread(
                 target=self._ask_copilot_and_insert,
                 args=(messages, self.view.sel()[0].begin())
             ).start()
 
+        copilot_cmd.warm_up()
         window.show_input_panel("Prompt (generate code):", "", on_done, None, None)
 
-    def _animate_progress(self):
+    def _animate_progress(self, step):
         if not getattr(self, "progress_active", False):
             return
 
+        self.progress_dots = step
         dots = "." * (self.progress_dots % 4)
 
         content = f'''
@@ -643,16 +1081,14 @@ class GithubCopilotGenerateCodeCommand(sublime_plugin.TextCommand):
 
         region = self.view.sel()[0]
         phantom = sublime.Phantom(region, content, sublime.LAYOUT_BLOCK)
-        self.phantom_set.update([phantom])
-
-        self.progress_dots += 1
-        sublime.set_timeout(self._animate_progress, 500)
+        UI_SCHEDULER.set_phantoms(self.view, self.phantom_set, [phantom])
 
 
     def _stop_progress(self):
         self.progress_active = False
+        UI_SCHEDULER.stop(self.view, "copilot_gen_progress")
         if hasattr(self, "phantom_set"):
-            self.phantom_set.update([])
+            UI_SCHEDULER.set_phantoms(self.view, self.phantom_set, [])
 
     def _ask_copilot_and_insert(self, messages, insert_pt):
         window = self.view.window()
@@ -666,34 +1102,26 @@ class GithubCopilotGenerateCodeCommand(sublime_plugin.TextCommand):
                 "max_tokens": 2000,
                 "stream": False
             }
-            data = json.dumps(payload).encode()
-            req = urllib.request.Request(COPILOT_API_URL, data=data)
-            req.add_header('Authorization', f'Bearer {copilot_cmd.access_token}')
-            req.add_header('Content-Type', 'application/json')
-            req.add_header('Accept', 'application/json')
-            req.add_header('User-Agent', 'GitHubCopilot/1.200.0.0 (sublime; 4169; x64)')
-
-            with urllib.request.urlopen(req, timeout=45) as response:
-                result = json.loads(response.read().decode())
-                if 'choices' in result and result['choices']:
-                    assistant_message = result['choices'][0]['message']['content']
-                    code, explanation = self._split_code_and_explanation(assistant_message)
-                    sublime.set_timeout(lambda: [
-                        self._stop_progress(),
-                        self.view.run_command(
-                            "insert_generated_code",
-                            {
-                                "code": code,
-                                "explanation": explanation,
-                                "pt": insert_pt
-                            }
-                        )
-                    ], 0)
+            result, _ = _routed_request(copilot_cmd.settings, copilot_cmd.access_token, payload)
+            if 'choices' in result and result['choices']:
+                assistant_message = result['choices'][0]['message']['content']
+                code, explanation = self._split_code_and_explanation(assistant_message)
+                UI_SCHEDULER.post(self.view, lambda: [
+                    self._stop_progress(),
+                    self.view.run_command(
+                        "insert_generated_code",
+                        {
+                            "code": code,
+                            "explanation": explanation,
+                            "pt": insert_pt
+                        }
+                    )
+                ])
         except Exception as e:
-            sublime.set_timeout(lambda e=e: [
+            UI_SCHEDULER.post(self.view, lambda e=e: [
                 self._stop_progress(),
                 sublime.error_message(f"Copilot error: {e}")
-            ], 0)
+            ])
 
     def _split_code_and_explanation(self, text):
         code = ""
@@ -745,3 +1173,320 @@ class GithubCopilotEditSettingsCommand(sublime_plugin.ApplicationCommand):
         sublime.active_window().open_file(
             "${packages}/User/github_copilot.sublime-settings".replace("${packages}", sublime.packages_path())
         )
+
+class RateLimiter:
+    """Spaces requests evenly so a worker pool stays under a requests-per-minute budget"""
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        with self.lock:
+            slot = max(time.monotonic(), self.next_slot)
+            self.next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0: time.sleep(delay)
+
+    def backoff(self, seconds):
+        """Push every pending slot back, e.g. after an HTTP 429"""
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+def _extract_code_block(text, original=""):
+    """Return the body of the outermost fenced block, or None if there is no single complete one.
+
+    The match runs to the last fence of the same length, so a reply with trailing
+    prose or several blocks is rejected rather than glued together.
+    """
+    match = re.search(r'^(`{3,})[^\n`]*\n(.*\n)?\1[ \t]*$', text, re.DOTALL | re.MULTILINE)
+    if not match or text[match.end():].strip(): return None
+    body = match.group(2) or ""
+    bare_fence = re.compile(r'^' + match.group(1) + r'[ \t]*$', re.MULTILINE)
+    if len(bare_fence.findall(body)) > len(bare_fence.findall(original.replace("\r\n", "\n"))): return None
+    return body
+
+def _sha1(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class BatchEditJob:
+    """Applies one prompt to many files through a bounded, rate-limited worker pool.
+
+    Each result is appended to a JSON-lines checkpoint in the cache folder, so
+    running the same glob + prompt again resumes where an interrupted run stopped.
+    Nothing is written to disk until the diff has been reviewed and applied.
+    """
+    def __init__(self, window, copilot_cmd, root, pattern, prompt):
+        self.window = window
+        self.copilot_cmd = copilot_cmd
+        self.root = root
+        self.pattern = pattern
+        self.prompt = prompt
+        self.files = sorted(
+            os.path.relpath(p, root) for p in glob.glob(os.path.join(root, pattern), recursive=True)
+            if os.path.isfile(p)
+        )
+        settings = copilot_cmd.settings
+        self.max_workers = max(1, settings.get("batch_max_workers", 4))
+        self.limiter = RateLimiter(settings.get("batch_requests_per_minute", 30))
+        # One model for the whole batch so a migration is not answered by a mix of models
+        self.model = settings.get("selected_model", "gpt-4o")
+        self.max_tokens = settings.get("batch_max_tokens", 16000)
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.finished = False
+        self.completed = 0
+        self.checkpoint_error = None
+        self.originals = {}
+
+        key = _sha1(f"{root}\n{pattern}\n{prompt}\n{self.model}")
+        self.checkpoint_path = os.path.join(sublime.cache_path(), "GitHubCopilot", f"batch_{key}.jsonl")
+        self.checkpoint_lock = threading.Lock()
+        self.checkpoint = self.load_checkpoint()
+
+    def load_checkpoint(self):
+        """Merge the per-file records; a later record for the same path wins"""
+        results = {}
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")
+            for line in lines:
+                try: record = json.loads(line)
+                except ValueError: continue  # partial line from an interrupted write
+                if isinstance(record, dict) and "path" in record:
+                    results[record["path"]] = record["entry"]
+            if lines[-1]:
+                # Terminate a partial last line so the next append starts on a fresh line
+                with open(self.checkpoint_path, "a", encoding="utf-8") as f: f.write("\n")
+        except OSError:
+            pass
+        return {"root": self.root, "pattern": self.pattern, "prompt": self.prompt, "results": results}
+
+    def save_checkpoint(self, rel_path, entry):
+        """Append one file's result, so each write stays small whatever the batch size"""
+        line = json.dumps({"path": rel_path, "entry": entry}) + "\n"
+        with self.checkpoint_lock:
+            os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+            with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def discard_checkpoint(self):
+        try: os.remove(self.checkpoint_path)
+        except OSError: pass
+
+    def start(self):
+        threading.Thread(target=self.run).start()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [(rel_path, pool.submit(self.process_file, rel_path)) for rel_path in self.files]
+        for rel_path, future in futures:
+            error = future.exception()
+            if error is not None:
+                print(f"GitHub Copilot batch edit: {rel_path} failed: {error}")
+                self.record(rel_path, {"status": "error", "error": f"internal error: {error}"})
+        self.finished = True
+        if self.cancelled:
+            sublime.set_timeout(lambda: sublime.status_message(
+                f"Batch edit cancelled after {self.completed}/{len(self.files)} files. Run it again to resume."), 0)
+        else:
+            sublime.set_timeout(self.show_diff_view, 0)
+
+    def process_file(self, rel_path):
+        if self.cancelled: return
+        abs_path = os.path.join(self.root, rel_path)
+        try:
+            with open(abs_path, "r", encoding="utf-8", newline="") as f: original = f.read()
+        except Exception as e:
+            self.record(rel_path, {"status": "error", "error": f"gagal dibaca: {e}"})
+            return
+        self.originals[rel_path] = original
+        digest = _sha1(original)
+
+        previous = self.checkpoint["results"].get(rel_path)
+        if previous and previous.get("status") == "done" and previous.get("sha1") == digest:
+            self.record(rel_path, previous, save=False)
+            return
+
+        # Rough token estimate (~3 chars per token) with headroom for the edit
+        max_tokens = len(original) // 3 * 3 // 2 + 512
+        if max_tokens > self.max_tokens:
+            self.record(rel_path, {"status": "error", "error": "file too large for batch edit"})
+            return
+
+        messages = []
+        base_prompt = self.copilot_cmd.settings.get("base_prompt_batch_edit", "")
+        if base_prompt:
+            messages.append({"role": "system", "content": base_prompt})
+        text = original.replace("\r\n", "\n")
+        fence = "````" if "```" in text else "```"
+        messages.append({"role": "user", "content": f"{self.prompt}\n\n# file: {rel_path}\n{fence}\n{text}\n{fence}"})
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.2,
+            "max_tokens": max_tokens,
+            "stream": False
+        }
+
+        entry = None
+        for attempt in range(3):
+            if self.cancelled: return
+            self.limiter.wait()
+            try:
+                result = _copilot_request(self.copilot_cmd.access_token, payload, timeout=120)
+                if not result.get('choices'):
+                    raise Exception(f"Invalid response format: {result}")
+                choice = result['choices'][0]
+                if choice.get('finish_reason') != "stop":
+                    raise Exception(f"incomplete reply (finish_reason: {choice.get('finish_reason')})")
+                code = _extract_code_block(choice['message']['content'], original)
+                if code is None:
+                    raise Exception("reply has no complete code block")
+                if not original.endswith("\n") and code.endswith("\n"): code = code[:-1]
+                if "\r\n" in original: code = code.replace("\r\n", "\n").replace("\n", "\r\n")
+                entry = {"status": "done", "sha1": digest, "code": code}
+                break
+            except urllib.error.HTTPError as e:
+                if e.code == 429 or e.code >= 500:
+                    entry = {"status": "error", "error": f"HTTP {e.code}, retries exhausted"}
+                    retry_after = e.headers.get("Retry-After") if e.headers else None
+                    self.limiter.backoff(float(retry_after) if retry_after and retry_after.isdigit() else 2 ** (attempt + 2))
+                    continue
+                entry = {"status": "error", "error": f"HTTP {e.code}"}
+                break
+            except Exception as e:
+                entry = {"status": "error", "error": str(e)}
+                break
+        self.record(rel_path, entry)
+
+    def record(self, rel_path, entry, save=True):
+        with self.lock:
+            self.checkpoint["results"][rel_path] = entry
+            self.completed += 1
+            done, total = self.completed, len(self.files)
+        if save:
+            try: self.save_checkpoint(rel_path, entry)
+            except OSError as e:
+                # Keep going; the run just cannot be resumed from this point
+                self.checkpoint_error = str(e)
+                print(f"GitHub Copilot batch edit: checkpoint not saved: {e}")
+        sublime.set_timeout(lambda: sublime.status_message(f"GitHub Copilot batch edit: {done}/{total} files"), 0)
+
+    def pending_changes(self):
+        """Return [(rel_path, original, new_code)] for files the model actually changed"""
+        changes = []
+        for rel_path in self.files:
+            entry = self.checkpoint["results"].get(rel_path, {})
+            original = self.originals.get(rel_path)
+            if entry.get("status") == "done" and original is not None and entry["code"] != original:
+                changes.append((rel_path, original, entry["code"]))
+        return changes
+
+    def show_diff_view(self):
+        changes = self.pending_changes()
+        errors = [(p, e.get("error")) for p, e in self.checkpoint["results"].items() if e.get("status") == "error"]
+
+        header = f"=== GitHub Copilot Batch Edit ===\nPrompt: {self.prompt}\nFiles: {len(self.files)} matched, {len(changes)} changed, {len(errors)} failed\n"
+        header += "Run 'GitHub Copilot: Apply Batch Edit' to write these changes.\n"
+        if self.checkpoint_error:
+            header += f"Warning: progress checkpoint could not be saved ({self.checkpoint_error}).\n"
+        for rel_path, error in errors:
+            header += f"  ! {rel_path}: {error}\n"
+
+        diff_text = ""
+        for rel_path, original, code in changes:
+            for line in difflib.unified_diff(
+                original.replace("\r\n", "\n").splitlines(True), code.replace("\r\n", "\n").splitlines(True),
+                fromfile=f"a/{rel_path}", tofile=f"b/{rel_path}"
+            ):
+                diff_text += line
+                if not line.endswith("\n"): diff_text += "\n\\ No newline at end of file\n"
+
+        view = self.window.new_file()
+        view.set_name("GitHub Copilot Batch Diff")
+        view.set_scratch(True)
+        view.assign_syntax("Packages/Diff/Diff.sublime-syntax")
+        view.run_command("append", {"characters": header + "\n" + diff_text})
+        view.set_read_only(True)
+
+    def apply(self):
+        """Write reviewed changes, skipping files edited since the batch read them"""
+        written, skipped = 0, []
+        for rel_path, original, code in self.pending_changes():
+            abs_path = os.path.join(self.root, rel_path)
+            try:
+                with open(abs_path, "r", encoding="utf-8", newline="") as f:
+                    if f.read() != original:
+                        skipped.append(rel_path); continue
+                with open(abs_path, "w", encoding="utf-8", newline="") as f: f.write(code)
+                written += 1
+            except Exception as e:
+                skipped.append(f"{rel_path} ({e})")
+        self.discard_checkpoint()
+        return written, skipped
+
+class GithubCopilotBatchEditCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        copilot_cmd = GithubCopilotCommand.get_instance(self.window)
+        if not copilot_cmd.is_authenticated():
+            sublime.error_message("Please authenticate first.")
+            return
+        if not self.window.folders():
+            sublime.error_message("Batch edit needs an open project folder.")
+            return
+        job = getattr(copilot_cmd, "batch_job", None)
+        if job and not job.finished:
+            sublime.error_message("A batch edit is already running. Run 'GitHub Copilot: Cancel Batch Edit' first.")
+            return
+
+        def on_pattern(pattern):
+            pattern = pattern.strip()
+            if not pattern: return
+            self.window.show_input_panel(
+                "Prompt for Copilot (batch edit):", "",
+                lambda prompt: self.start_batch(copilot_cmd, pattern, prompt.strip()), None, None
+            )
+
+        self.window.show_input_panel("Batch edit file glob (e.g. src/**/*.py):", "", on_pattern, None, None)
+
+    def start_batch(self, copilot_cmd, pattern, prompt):
+        if not prompt: return
+        job = BatchEditJob(self.window, copilot_cmd, self.window.folders()[0], pattern, prompt)
+        if not job.files:
+            sublime.error_message(f"No files match '{pattern}'.")
+            return
+        resumed = len(job.checkpoint["results"])
+        if resumed:
+            sublime.status_message(f"Resuming batch edit: {resumed}/{len(job.files)} files already processed")
+        copilot_cmd.batch_job = job
+        job.start()
+
+class GithubCopilotApplyBatchEditCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        copilot_cmd = GithubCopilotCommand.get_instance(self.window)
+        job = getattr(copilot_cmd, "batch_job", None)
+        if not job or not job.finished or job.cancelled:
+            sublime.error_message("No finished batch edit to apply.")
+            return
+        written, skipped = job.apply()
+        copilot_cmd.batch_job = None
+        message = f"Batch edit applied to {written} files."
+        if skipped:
+            message += "\nSkipped (modified since the batch read them):\n" + "\n".join(skipped)
+        sublime.message_dialog(message)
+
+class GithubCopilotCancelBatchEditCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        copilot_cmd = GithubCopilotCommand.get_instance(self.window)
+        job = getattr(copilot_cmd, "batch_job", None)
+        if not job or job.finished:
+            sublime.status_message("No batch edit is running.")
+            return
+        job.cancelled = True
+        sublime.status_message("Cancelling batch edit, progress is kept for resume...")
+
+def plugin_loaded():
+    window = sublime.active_window()
+    if window:
+        GithubCopilotCommand.get_instance(window).warm_up()